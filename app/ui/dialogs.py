@@ -27,36 +27,20 @@
 
 
 """ Common module for showing dialogs """
-import gettext
+import os
+from contextlib import suppress
 from enum import Enum
 from functools import lru_cache
+from io import StringIO
 from pathlib import Path
-import xml.etree.ElementTree as ET
 
-from app.commons import run_idle
-from app.settings import SEP, IS_WIN
+from app.commons import run_idle, log
+from app.settings import SEP, IS_WIN, IS_LINUX, HOME_PATH
 from .uicommons import Gtk, UI_RESOURCES_PATH, TEXT_DOMAIN, IS_GNOME_SESSION
 
 
-class Dialog(Enum):
-    MESSAGE = """
-    <?xml version="1.0" encoding="UTF-8"?>
-    <interface>
-      <requires lib="gtk+" version="3.16"/>
-      <object class="GtkMessageDialog" id="message_dialog">
-        <property name="use-header-bar">{use_header}</property>
-        <property name="can_focus">False</property>
-        <property name="modal">True</property>
-        <property name="width_request">250</property>
-        <property name="destroy_with_parent">True</property>
-        <property name="type_hint">dialog</property>
-        <property name="skip_taskbar_hint">True</property>
-        <property name="skip_pager_hint">True</property>
-        <property name="message_type">{message_type}</property>
-        <property name="buttons">{buttons_type}</property>
-      </object>
-    </interface>
-  """
+# Path to the cache of the translated *.glade files [MS Windows].
+_CACHE_PATH = f"{HOME_PATH}{SEP}.cache{SEP}demon-editor{SEP}"
 
 
 class Action(Enum):
@@ -73,6 +57,12 @@ class DialogType(Enum):
     ABOUT = "about"
     WAIT = "wait"
 
+    def __new__(cls, value):
+        obj = object.__new__(cls)
+        obj._value_ = value
+        obj.dialog_name = f"{value}_dialog"
+        return obj
+
     def __str__(self):
         return self.value
 
@@ -81,9 +71,8 @@ class WaitDialog:
     def __init__(self, transient, text=None):
         builder, dialog = get_dialog_from_xml(DialogType.WAIT, transient)
         self._dialog = dialog
-        self._dialog.set_transient_for(transient)
         self._label = builder.get_object("wait_dialog_label")
-        self._default_text = text or self._label.get_text()
+        self._default_text = get_message(text or self._label.get_text())
 
     def show(self, text=None):
         self.set_text(text)
@@ -91,7 +80,7 @@ class WaitDialog:
 
     @run_idle
     def set_text(self, text):
-        self._label.set_text(get_message(text or self._default_text))
+        self._label.set_text(get_message(text) if text else self._default_text)
 
     @run_idle
     def hide(self):
@@ -105,25 +94,27 @@ class WaitDialog:
 def show_dialog(dialog_type, transient, text=None, settings=None, action_type=None, file_filter=None, buttons=None,
                 title=None, create_dir=False):
     """ Shows dialogs by name. """
-    if dialog_type in (DialogType.INFO, DialogType.ERROR):
-        return get_message_dialog(transient, dialog_type, Gtk.ButtonsType.OK, text)
-    elif dialog_type is DialogType.CHOOSER and settings:
-        return get_file_chooser_dialog(transient, text, settings, action_type, file_filter, buttons, title, create_dir)
-    elif dialog_type is DialogType.INPUT:
-        return get_input_dialog(transient, text)
-    elif dialog_type is DialogType.QUESTION:
-        action = action_type if action_type else Gtk.ButtonsType.OK_CANCEL
-        return get_message_dialog(transient, DialogType.QUESTION, action, text or "Are you sure?")
-    elif dialog_type is DialogType.ABOUT:
-        return get_about_dialog(transient)
+    handler = _DIALOG_HANDLERS.get(dialog_type, None)
+    if handler:
+        return handler(transient, text, settings=settings, action_type=action_type, file_filter=file_filter,
+                       buttons=buttons, title=title, create_dir=create_dir)
+
+
+_DIALOG_HANDLERS = {
+    DialogType.INFO: lambda t, text, **kw: get_message_dialog(t, Gtk.MessageType.INFO, Gtk.ButtonsType.OK, text),
+    DialogType.ERROR: lambda t, text, **kw: get_message_dialog(t, Gtk.MessageType.ERROR, Gtk.ButtonsType.OK, text),
+    DialogType.CHOOSER: lambda t, text, settings, action_type, file_filter, buttons, title, create_dir: (
+        get_file_chooser_dialog(t, text, settings, action_type=action_type, file_filter=file_filter,
+                                buttons=buttons, title=title, dirs=create_dir) if settings else None),
+    DialogType.INPUT: lambda t, text, **kw: get_input_dialog(t, text),
+    DialogType.QUESTION: lambda t, text, action_type, **kw: get_message_dialog(
+        t, Gtk.MessageType.QUESTION, action_type or Gtk.ButtonsType.OK_CANCEL, text or "Are you sure?"),
+    DialogType.ABOUT: lambda t, text, **kw: get_about_dialog(t)
+}
 
 
 def get_chooser_dialog(transient, settings, name, patterns, title=None, file_filter=None):
-    if not file_filter:
-        file_filter = Gtk.FileFilter()
-        file_filter.set_name(name)
-        for p in patterns:
-            file_filter.add_pattern(p)
+    file_filter = file_filter or _get_file_filter(name, tuple(patterns))
 
     return show_dialog(dialog_type=DialogType.CHOOSER,
                        transient=transient,
@@ -133,6 +124,20 @@ def get_chooser_dialog(transient, settings, name, patterns, title=None, file_fil
                        title=title)
 
 
+@lru_cache(maxsize=16)
+def _get_file_filter(name, patterns):
+    """ Returns a reusable file filter.
+
+        The chooser only adds its own reference to the filter, so it can be shared between dialogs.
+    """
+    file_filter = Gtk.FileFilter()
+    file_filter.set_name(name)
+    for p in patterns:
+        file_filter.add_pattern(p)
+
+    return file_filter
+
+
 def get_file_chooser_dialog(transient, text, settings, action_type, file_filter, buttons=None, title=None, dirs=False):
     action_type = Gtk.FileChooserAction.SELECT_FOLDER if action_type is None else action_type
     dialog = Gtk.FileChooserNative.new(get_message(title) if title else "", transient, action_type)
@@ -159,7 +164,8 @@ def get_file_chooser_dialog(transient, text, settings, action_type, file_filter,
 def get_input_dialog(transient, text):
     builder, dialog = get_dialog_from_xml(DialogType.INPUT, transient, use_header=IS_GNOME_SESSION)
     entry = builder.get_object("input_entry")
-    entry.set_text(text if text else "")
+    if text:
+        entry.set_text(text)
     response = dialog.run()
     txt = entry.get_text()
     dialog.destroy()
@@ -168,12 +174,16 @@ def get_input_dialog(transient, text):
 
 
 def get_message_dialog(transient, message_type, buttons_type, text):
-    builder = Gtk.Builder()
-    builder.set_translation_domain(TEXT_DOMAIN)
-    dialog_str = Dialog.MESSAGE.value.format(use_header=0, message_type=message_type, buttons_type=int(buttons_type))
-    builder.add_from_string(dialog_str)
-    dialog = builder.get_object("message_dialog")
-    dialog.set_transient_for(transient)
+    dialog = Gtk.MessageDialog(transient_for=transient,
+                               use_header_bar=0,
+                               can_focus=False,
+                               modal=True,
+                               width_request=250,
+                               destroy_with_parent=True,
+                               skip_taskbar_hint=True,
+                               skip_pager_hint=True,
+                               message_type=message_type,
+                               buttons=buttons_type)
     dialog.set_markup(get_message(text))
     response = dialog.run()
     dialog.destroy()
@@ -183,7 +193,6 @@ def get_message_dialog(transient, message_type, buttons_type, text):
 
 def get_about_dialog(transient):
     builder, dialog = get_dialog_from_xml(DialogType.ABOUT, transient)
-    dialog.set_transient_for(transient)
     response = dialog.run()
     dialog.destroy()
 
@@ -191,41 +200,93 @@ def get_about_dialog(transient):
 
 
 def get_dialog_from_xml(dialog_type, transient, use_header=0, title=""):
-    dialog_name = dialog_type.value + "_dialog"
-    builder = Gtk.Builder()
-    builder.set_translation_domain(TEXT_DOMAIN)
-    dialog_str = get_dialogs_string(UI_RESOURCES_PATH + "dialogs.glade").format(use_header=use_header, title=title)
-    builder.add_objects_from_string(dialog_str, (dialog_name,))
+    dialog_name = dialog_type.dialog_name
+    builder = _create_builder()
+    dialog_str = _get_glade_objects(UI_RESOURCES_PATH + "dialogs.glade")[dialog_name]
+    builder.add_objects_from_string(dialog_str.format(use_header=use_header, title=title), (dialog_name,))
     dialog = builder.get_object(dialog_name)
     dialog.set_transient_for(transient)
 
     return builder, dialog
 
 
+def _create_builder():
+    """ Returns a new Gtk.Builder instance.
+
+        On Linux, the default translation domain is set once on startup [see uicommons].
+    """
+    builder = Gtk.Builder()
+    if not IS_LINUX:
+        builder.set_translation_domain(TEXT_DOMAIN)
+
+    return builder
+
+
 def get_message(message):
     """ returns translated message """
+    return _translate(message)
+
+
+@lru_cache(maxsize=1024)
+def _translate(message):
+    """ Cached gettext lookup.
+
+        The language is applied only on program start,
+        call _translate.cache_clear() if it is changed at runtime.
+    """
+    import gettext
     return gettext.dgettext(TEXT_DOMAIN, message)
 
 
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=32)
 def get_dialogs_string(path, tag="property"):
     if IS_WIN:
-        return translate_xml(path, tag)
+        return _get_translated_string(path, tag)
     else:
         with open(path, "r", encoding="utf-8") as f:
-            return "".join(f)
+            return f.read()
+
+
+@lru_cache(maxsize=16)
+def _get_formatted_dialog_string(path, tag, use_header, title=""):
+    """ Returns the dialogs string with already substituted placeholders. """
+    if IS_WIN:
+        return _get_translated_string(path, tag, use_header, title)
+    return get_dialogs_string(path, tag).format(use_header=use_header, title=title)
+
+
+@lru_cache(maxsize=4)
+def _get_glade_objects(path, tag="property"):
+    """ Returns a dict of the top-level objects [id -> interface string] from the *.glade file.
+
+        Allows to load a single dialog without processing the whole file.
+    """
+    import xml.etree.ElementTree as ET
+    root = ET.fromstring(get_dialogs_string(path, tag)) if IS_WIN else ET.parse(path).getroot()
+
+    requires = "".join(ET.tostring(r, encoding="unicode") for r in root.iterfind("requires"))
+    return {o.attrib["id"]: f"<interface>{requires}{ET.tostring(o, encoding='unicode')}</interface>"
+            for o in root.iterfind("object")}
+
+
+@run_idle
+def _prewarm_glade_objects():
+    """ Fills the dialogs objects cache when the main loop is idle, so that the first dialog is not delayed. """
+    try:
+        _get_glade_objects(UI_RESOURCES_PATH + "dialogs.glade")
+    except (OSError, SyntaxError) as e:
+        log(f"Error loading dialogs: {e}")
 
 
 def get_builder(path, handlers=None, use_str=False, objects=None, tag="property"):
     """ Creates and returns a Gtk.Builder instance. """
-    builder = Gtk.Builder()
-    builder.set_translation_domain(TEXT_DOMAIN)
+    builder = _create_builder()
 
     if use_str:
         if objects:
-            builder.add_objects_from_string(get_dialogs_string(path, tag).format(use_header=IS_GNOME_SESSION), objects)
+            builder.add_objects_from_string(_get_formatted_dialog_string(path, tag, IS_GNOME_SESSION), objects)
         else:
-            builder.add_from_string(get_dialogs_string(path, tag).format(use_header=IS_GNOME_SESSION))
+            builder.add_from_string(_get_formatted_dialog_string(path, tag, IS_GNOME_SESSION))
     else:
         if objects:
             builder.add_objects_from_string(get_dialogs_string(path, tag), objects)
@@ -237,20 +298,118 @@ def get_builder(path, handlers=None, use_str=False, objects=None, tag="property"
     return builder
 
 
-def translate_xml(path, tag="property"):
+def _get_translated_string(path, tag="property", use_header=None, title=None):
+    """ Returns the translated *.glade file string from the disk cache or translates and caches it.
+
+        The cache file key depends on the modification time of the file and of the used translation catalog.
+    """
+    import gettext
+    import hashlib
+    import tempfile
+    # The same catalog lookup as in translate_xml [None if there is no translation].
+    catalog = gettext.find(TEXT_DOMAIN, gettext.bindtextdomain(TEXT_DOMAIN))
+    catalog_mtime = os.path.getmtime(catalog) if catalog else None
+    key = f"{path}:{os.path.getmtime(path)}:{catalog}:{catalog_mtime}:{tag}:{use_header}:{title}"
+    # The variant part of the name allows removing outdated files of the same string variant.
+    variant = f"{Path(path).stem}-{hashlib.sha1(f'{tag}:{use_header}:{title}'.encode()).hexdigest()[:8]}"
+    cache_file = f"{_CACHE_PATH}{variant}-{hashlib.sha1(key.encode()).hexdigest()}.glade"
+
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            log(f"Error reading the translation cache: {e}")
+            with suppress(OSError):
+                os.remove(cache_file)
+
+    data = translate_xml(path, tag, use_header, title)
+    tmp_file = None
+    try:
+        os.makedirs(_CACHE_PATH, exist_ok=True)
+        # Written to a temporary file first to never leave a partially written cache file.
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=_CACHE_PATH, suffix=".tmp", delete=False) as f:
+            tmp_file = f.name
+            f.write(data)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        log(f"Error writing the translation cache: {e}")
+        if tmp_file:
+            with suppress(OSError):
+                os.remove(tmp_file)
+    else:
+        for p in Path(_CACHE_PATH).glob(f"{variant}-*.glade"):
+            if str(p) != str(Path(cache_file)):
+                with suppress(OSError):
+                    p.unlink()
+
+    return data
+
+
+def translate_xml(path, tag="property", use_header=None, title=None):
     """
         Used to translate GUI from * .glade files in MS Windows.
 
+        If use_header is set, the {use_header} and {title} placeholders are substituted in the same pass.
         More info: https://gitlab.gnome.org/GNOME/gtk/-/issues/569
     """
-    et = ET.parse(path)
-    root = et.getroot()
-    for e in root.iter(tag):
-        if e.attrib.get("translatable", None) == "yes":
-            e.text = get_message(e.text)
-
-    return ET.tostring(root, encoding="unicode", method="xml")
-
+    import gettext
+    import xml.etree.ElementTree as ET
+    from xml.sax.saxutils import escape, quoteattr
+    # The catalog is loaded once for the whole file [the same lookup as in gettext.dgettext].
+    # Safe here, because the GUI is built in the main thread only.
+    translate = gettext.translation(TEXT_DOMAIN, gettext.bindtextdomain(TEXT_DOMAIN), fallback=True).gettext
+    values = {} if use_header is None else {"{use_header}": str(use_header), "{title}": title or ""}
+    parser = ET.XMLParser(target=_TranslateTarget(tag, values, translate, escape, quoteattr))
+    with open(path, "rb") as f:
+        parser.feed(f.read())
+
+    return parser.close()
+
+
+class _TranslateTarget:
+    """ Parser target that translates and serializes the XML in a single pass. """
+
+    def __init__(self, tag, values, translate, escape, quoteattr):
+        self._tag = tag
+        self._values = values
+        self._translate = translate
+        self._escape = escape
+        self._quoteattr = quoteattr
+        self._translatable = False
+        self._data = []
+        self._out = StringIO()
+
+    def start(self, tag, attrib):
+        self._flush()
+        self._translatable = tag == self._tag and attrib.get("translatable", None) == "yes"
+        attrs = "".join(f" {k}={self._quoteattr(v)}" for k, v in attrib.items())
+        self._out.write(f"<{tag}{attrs}>")
+
+    def data(self, text):
+        self._data.append(text)
+
+    def end(self, tag):
+        self._flush()
+        self._translatable = False
+        self._out.write(f"</{tag}>")
+
+    def close(self):
+        self._flush()
+        return self._out.getvalue()
+
+    def _flush(self):
+        if self._data:
+            text = "".join(self._data)
+            self._data.clear()
+            if text in self._values:
+                text = self._values[text]
+            elif self._translatable and text:
+                text = self._translate(text)
+            self._out.write(self._escape(text))
+
+
+_prewarm_glade_objects()
 
 if __name__ == "__main__":
     pass
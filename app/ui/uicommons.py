@@ -82,6 +82,8 @@ else:
 if IS_LINUX:
     if UI_RESOURCES_PATH == BASE_PATH:
         locale.bindtextdomain(TEXT_DOMAIN, LANG_PATH)
+    # Default translation domain for all Gtk.Builder instances.
+    locale.textdomain(TEXT_DOMAIN)
     # Init notify
     try:
         gi.require_version("Notify", "0.7")